@@ -0,0 +1,607 @@
+"""Offline reconcile planner for the secret copier and secret injector.
+
+Loads ``SecretCopierConfig`` and ``SecretInjectorConfig`` resources along
+with a snapshot of a cluster, such as the output from running::
+
+    kubectl get namespaces,secrets,serviceaccounts -A -o json
+
+and works out what the operator would do if the configs were applied,
+without talking to a cluster. The matching logic used is that from the
+``secret_copier.functions`` and ``secret_injector.functions`` modules.
+The plan is printed along with the number of namespaces matched, the
+number of objects written and an estimate of the number of API reads
+and writes which reconciliation of each config would make.
+
+This module is intended to be run as a script and not imported.
+
+"""
+
+import sys
+
+if __name__ == "__main__":
+    # The operator.py in this directory shadows the standard library
+    # module of the same name when this file is run as a script, so move
+    # the directory to the end of the module search path.
+
+    sys.path.append(sys.path.pop(0))
+
+import argparse
+import collections
+import json
+
+import yaml
+
+from secret_copier import functions as copier_functions
+from secret_injector import functions as injector_functions
+
+lookup = copier_functions.lookup
+
+try:
+    YAMLLoader = yaml.CSafeLoader
+except AttributeError:
+    YAMLLoader = yaml.SafeLoader
+
+
+def warning(message):
+    print(f"warning: {message}", file=sys.stderr)
+
+
+class Snapshot:
+    """Index of the namespaces, secrets and service accounts in a cluster
+    snapshot, keyed so that lookups made while planning are cheap.
+
+    """
+
+    def __init__(self):
+        self.namespaces = {}
+        self.secrets = collections.defaultdict(dict)
+        self.service_accounts = collections.defaultdict(dict)
+
+    def add(self, obj):
+        kind = obj.get("kind")
+        name = lookup(obj, "metadata.name")
+        namespace = lookup(obj, "metadata.namespace")
+
+        if not kind:
+            warning(f"Ignoring resource {name} with no kind.")
+            return
+
+        if kind not in ("Namespace", "Secret", "ServiceAccount"):
+            return
+
+        if not name:
+            warning(f"Ignoring {kind} with no name.")
+            return
+
+        if kind == "Namespace":
+            self.namespaces[name] = obj
+            return
+
+        if not namespace:
+            warning(f"Ignoring {kind} {name} with no namespace.")
+            return
+
+        if kind == "Secret":
+            self.secrets[namespace][name] = obj
+        else:
+            self.service_accounts[namespace][name] = obj
+
+
+class Estimate:
+    """Counts of the namespaces matched, the objects written and the API
+    requests made when reconciling a config.
+
+    """
+
+    def __init__(self):
+        self.namespaces = set()
+        self.objects = set()
+        self.lists = 0
+        self.gets = 0
+        self.creates = 0
+        self.updates = 0
+
+    @property
+    def reads(self):
+        return self.lists + self.gets
+
+    @property
+    def writes(self):
+        return self.creates + self.updates
+
+    def __iadd__(self, other):
+        self.namespaces |= other.namespaces
+        self.objects |= other.objects
+        self.lists += other.lists
+        self.gets += other.gets
+        self.creates += other.creates
+        self.updates += other.updates
+        return self
+
+    def __str__(self):
+        return (
+            f"namespaces={len(self.namespaces)} objects={len(self.objects)} "
+            f"reads={self.reads} (list={self.lists}, get={self.gets}) "
+            f"writes={self.writes} (create={self.creates}, update={self.updates})"
+        )
+
+
+def list_requests(count, page_size):
+    """Returns the number of requests needed to list the given number of
+    objects when paging through them as ``list_objects()`` does.
+
+    """
+
+    if count <= page_size:
+        return 1
+
+    return -(-count // page_size)
+
+
+def check_resource(obj):
+    """Raises ``ValueError`` if the object doesn't look like a resource.
+
+    """
+
+    if not isinstance(obj, dict):
+        raise ValueError(f"expected a resource, found {type(obj).__name__}")
+
+    kind = obj.get("kind")
+
+    if kind is not None and not isinstance(kind, str):
+        raise ValueError(f"expected kind to be a string, found {type(kind).__name__}")
+
+    metadata = obj.get("metadata")
+
+    if metadata is not None and not isinstance(metadata, dict):
+        raise ValueError(
+            f"expected metadata to be a mapping, found {type(metadata).__name__}"
+        )
+
+    for key in ("name", "namespace"):
+        value = lookup(obj, f"metadata.{key}")
+
+        if value is not None and not isinstance(value, str):
+            raise ValueError(
+                f"expected metadata.{key} to be a string, found {type(value).__name__}"
+            )
+
+
+def load_documents(path):
+    """Returns the resources held in the file, expanding any ``List``
+    resources. JSON is tried first as it is much quicker to parse than
+    YAML for large snapshots. Raises ``ValueError`` if the file doesn't
+    hold resources.
+
+    """
+
+    with open(path) as fp:
+        content = fp.read()
+
+    try:
+        documents = [json.loads(content)]
+    except ValueError:
+        documents = yaml.load_all(content, Loader=YAMLLoader)
+
+    for document in documents:
+        if document is None:
+            continue
+
+        check_resource(document)
+
+        if (document.get("kind") or "").endswith("List"):
+            items = document.get("items") or []
+
+            if not isinstance(items, list):
+                raise ValueError(
+                    f"expected items to be a list, found {type(items).__name__}"
+                )
+
+            for item in items:
+                check_resource(item)
+
+                yield item
+
+        else:
+            yield document
+
+
+class Planner:
+    """Works out what reconciliation of configs would do against the
+    snapshot, updating the snapshot with the changes that would be made.
+
+    Secrets created or updated by the copier generate events which both
+    the copier and the injector handle. These are queued as they occur
+    and the requests they make are counted separately as follow-on
+    requests. Each config is only reconciled once in response to events
+    for the same secret, so that configs which keep updating the same
+    secret don't result in the planner never finishing.
+
+    """
+
+    def __init__(self, snapshot, copier_configs, injector_configs, page_size, output):
+        self.snapshot = snapshot
+        self.copier_configs = copier_configs
+        self.injector_configs = injector_configs
+        self.page_size = page_size
+        self.output = output
+
+        self.pending_events = collections.deque()
+        self.triggered_configs = set()
+
+    def plan_copier_config(self, config_obj):
+        """Returns the direct and follow-on estimates for applying a
+        copier config.
+
+        """
+
+        estimate = Estimate()
+
+        self.reconcile_copier_config(config_obj, estimate)
+
+        return estimate, self.process_events()
+
+    def plan_injector_config(self, config_obj):
+        """Returns the direct and follow-on estimates for applying an
+        injector config. The injector makes no changes to secrets, so
+        there are never any follow-on requests.
+
+        """
+
+        estimate = Estimate()
+
+        self.reconcile_injector_config(config_obj, estimate)
+
+        return estimate, self.process_events()
+
+    def process_events(self):
+        """Works through the queued secret events, returning an estimate
+        of the requests made in handling them.
+
+        """
+
+        estimate = Estimate()
+
+        while self.pending_events:
+            secret_name, namespace_name = self.pending_events.popleft()
+
+            # Mirrors reconcile_secret() in secret_injector.functions.
+
+            self.reconcile_injector_secret(secret_name, namespace_name, estimate)
+
+            # Mirrors reconcile_secret() in secret_copier.functions,
+            # which reconciles every config the secret is a source for.
+
+            configs = copier_functions.matches_source_secret(
+                secret_name, namespace_name, self.copier_configs
+            )
+
+            for config_obj in configs:
+                config_name = lookup(config_obj, "metadata.name")
+
+                key = (config_name, namespace_name, secret_name)
+
+                if key in self.triggered_configs:
+                    continue
+
+                self.triggered_configs.add(key)
+
+                self.reconcile_copier_config(config_obj, estimate)
+
+        return estimate
+
+    def reconcile_copier_config(self, config_obj, estimate):
+        """Mirrors the requests made by ``reconcile_config()`` and
+        ``update_secret()`` in ``secret_copier.functions``.
+
+        """
+
+        snapshot = self.snapshot
+
+        # Listing all namespaces.
+
+        estimate.lists += list_requests(len(snapshot.namespaces), self.page_size)
+
+        for namespace_name, namespace_obj in snapshot.namespaces.items():
+            rules = copier_functions.matches_target_namespace(
+                namespace_name, namespace_obj, [config_obj]
+            )
+
+            for rule in rules:
+                source_secret_name = lookup(rule, "sourceSecret.name")
+                source_secret_namespace = lookup(rule, "sourceSecret.namespace")
+
+                target_secret_name = lookup(
+                    rule, "targetSecret.name", source_secret_name
+                )
+                target_secret_namespace = namespace_name
+
+                if source_secret_namespace == target_secret_namespace:
+                    continue
+
+                estimate.namespaces.add(target_secret_namespace)
+
+                # Reading the source secret.
+
+                estimate.gets += 1
+
+                source_secret_obj = snapshot.secrets[source_secret_namespace].get(
+                    source_secret_name
+                )
+
+                if source_secret_obj is None:
+                    self.output(
+                        f"skip secret {source_secret_name} in namespace {source_secret_namespace} cannot be read"
+                    )
+                    continue
+
+                # Reading the target secret.
+
+                estimate.gets += 1
+
+                target_secret_obj = snapshot.secrets[target_secret_namespace].get(
+                    target_secret_name
+                )
+
+                if target_secret_obj is None:
+                    estimate.creates += 1
+
+                    target_secret_obj = copier_functions.new_target_secret(
+                        source_secret_obj,
+                        target_secret_name,
+                        target_secret_namespace,
+                        rule,
+                    )
+
+                    action = "create"
+
+                else:
+                    target_secret_obj = copier_functions.updated_target_secret(
+                        source_secret_obj, target_secret_obj, rule
+                    )
+
+                    if target_secret_obj is None:
+                        continue
+
+                    estimate.updates += 1
+
+                    action = "update"
+
+                # Record the change so later rules see it, the same as
+                # they would when running against the cluster, and queue
+                # the event the change would generate.
+
+                snapshot.secrets[target_secret_namespace][
+                    target_secret_name
+                ] = target_secret_obj
+
+                estimate.objects.add(
+                    ("Secret", target_secret_namespace, target_secret_name)
+                )
+
+                self.pending_events.append(
+                    (target_secret_name, target_secret_namespace)
+                )
+
+                self.output(
+                    f"{action} secret {target_secret_name} in namespace {target_secret_namespace} from secret {source_secret_name} in namespace {source_secret_namespace}"
+                )
+
+    def reconcile_injector_config(self, config_obj, estimate):
+        """Mirrors the requests made by ``reconcile_config()`` and
+        ``reconcile_namespace()`` in ``secret_injector.functions``.
+
+        """
+
+        snapshot = self.snapshot
+
+        # Listing all namespaces.
+
+        estimate.lists += list_requests(len(snapshot.namespaces), self.page_size)
+
+        for namespace_name, namespace_obj in snapshot.namespaces.items():
+            rules = injector_functions.matches_target_namespace(
+                namespace_name, namespace_obj, [config_obj]
+            )
+
+            for rule in rules:
+                estimate.namespaces.add(namespace_name)
+
+                # Listing the secrets in the namespace.
+
+                secrets = snapshot.secrets.get(namespace_name, {})
+
+                estimate.lists += list_requests(len(secrets), self.page_size)
+
+                for secret_name, secret_obj in secrets.items():
+                    if injector_functions.matches_source_secret(
+                        secret_name, secret_obj, rule
+                    ):
+                        self.inject_secret(namespace_name, secret_name, rule, estimate)
+
+    def reconcile_injector_secret(self, secret_name, namespace_name, estimate):
+        """Mirrors the requests made by ``reconcile_secret()`` in
+        ``secret_injector.functions``.
+
+        """
+
+        snapshot = self.snapshot
+
+        # Reading the namespace.
+
+        estimate.gets += 1
+
+        namespace_obj = snapshot.namespaces.get(namespace_name)
+
+        if namespace_obj is None:
+            return
+
+        secret_obj = snapshot.secrets[namespace_name][secret_name]
+
+        rules = injector_functions.matches_target_namespace(
+            namespace_name, namespace_obj, self.injector_configs
+        )
+
+        for rule in rules:
+            if injector_functions.matches_source_secret(secret_name, secret_obj, rule):
+                estimate.namespaces.add(namespace_name)
+
+                self.inject_secret(namespace_name, secret_name, rule, estimate)
+
+    def inject_secret(self, namespace_name, secret_name, rule, estimate):
+        """Mirrors the requests made in injecting a secret into the matching
+        service accounts of a namespace.
+
+        """
+
+        # Listing the service accounts in the namespace.
+
+        service_accounts = self.snapshot.service_accounts.get(namespace_name, {})
+
+        estimate.lists += list_requests(len(service_accounts), self.page_size)
+
+        for service_account_name, service_account_obj in service_accounts.items():
+            if not injector_functions.matches_service_account(
+                service_account_name, service_account_obj, rule
+            ):
+                continue
+
+            image_pull_secrets = injector_functions.injected_image_pull_secrets(
+                service_account_obj, secret_name
+            )
+
+            if image_pull_secrets is None:
+                continue
+
+            estimate.updates += 1
+
+            service_account_obj["imagePullSecrets"] = image_pull_secrets
+
+            estimate.objects.add(
+                ("ServiceAccount", namespace_name, service_account_name)
+            )
+
+            self.output(
+                f"inject secret {secret_name} into service account {service_account_name} in namespace {namespace_name}"
+            )
+
+
+def page_size_type(value):
+    """Validates that the page size is a positive integer.
+
+    """
+
+    try:
+        page_size = int(value)
+    except ValueError:
+        page_size = 0
+
+    if page_size <= 0:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: {value!r}")
+
+    return page_size
+
+
+def no_output(line):
+    pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Plan reconciliation of secret copier and injector configs "
+        "against a cluster snapshot, without making changes to a cluster."
+    )
+
+    parser.add_argument(
+        "-c",
+        "--config",
+        action="append",
+        default=[],
+        metavar="FILE",
+        help="file holding SecretCopierConfig/SecretInjectorConfig resources",
+    )
+    parser.add_argument(
+        "-s",
+        "--snapshot",
+        action="append",
+        default=[],
+        metavar="FILE",
+        help="file holding namespaces, secrets and service accounts",
+    )
+    parser.add_argument(
+        "-p",
+        "--page-size",
+        type=page_size_type,
+        # Same as injector_functions.list_page_size, which is kept in sync.
+        default=copier_functions.list_page_size,
+        metavar="N",
+        help="objects per page when listing resources (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        action="store_true",
+        help="only output the per config and total counts",
+    )
+
+    args = parser.parse_args(argv)
+
+    # Resources are sorted by kind, so it doesn't matter whether configs
+    # are supplied in the snapshot or in separate files.
+
+    copier_configs = []
+    injector_configs = []
+
+    snapshot = Snapshot()
+
+    for path in args.config + args.snapshot:
+        try:
+            for obj in load_documents(path):
+                kind = obj.get("kind")
+                if kind == "SecretCopierConfig":
+                    copier_configs.append(obj)
+                elif kind == "SecretInjectorConfig":
+                    injector_configs.append(obj)
+                else:
+                    snapshot.add(obj)
+
+        except (OSError, ValueError, yaml.YAMLError) as e:
+            parser.error(f"{path}: {e}")
+
+    output = no_output if args.quiet else print
+
+    planner = Planner(
+        snapshot, copier_configs, injector_configs, args.page_size, output
+    )
+
+    total = Estimate()
+    total_follow_on = Estimate()
+
+    # Copier configs are planned first so that any copied secrets are
+    # visible when planning the injector configs.
+
+    plans = [
+        ("SecretCopierConfig", copier_configs, planner.plan_copier_config),
+        ("SecretInjectorConfig", injector_configs, planner.plan_injector_config),
+    ]
+
+    for kind, configs, plan in plans:
+        for config_obj in configs:
+            config_name = lookup(config_obj, "metadata.name")
+
+            output(f"# {kind} {config_name}")
+
+            estimate, follow_on = plan(config_obj)
+
+            print(f"{kind} {config_name}: {estimate}")
+            print(f"{kind} {config_name} follow-on: {follow_on}")
+
+            total += estimate
+            total_follow_on += follow_on
+
+    print(f"Total: {total}")
+    print(f"Total follow-on: {total_follow_on}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,49 @@
+import logging
+import os
 import threading
 import pykube
+import requests
 
 global_configs = {}
 
 
+def get_list_page_size(default=500):
+    """Returns the number of objects to request per page when listing
+    resources. Can be overridden using the LIST_PAGE_SIZE environment
+    variable, but must be a positive integer, as a limit of zero would
+    disable paging altogether.
+
+    """
+
+    value = os.environ.get("LIST_PAGE_SIZE")
+
+    if value is None:
+        return default
+
+    try:
+        page_size = int(value)
+    except ValueError:
+        page_size = 0
+
+    if page_size <= 0:
+        logging.getLogger(__name__).warning(
+            f"Ignoring invalid LIST_PAGE_SIZE of {value!r}, must be a positive integer."
+        )
+        return default
+
+    return page_size
+
+
+# The page size and list_objects() are kept identical to those in
+# secret_injector.functions, as each package is self contained.
+
+list_page_size = get_list_page_size()
+
+logging.getLogger(__name__).info(
+    f"Listing resources with page size of {list_page_size}."
+)
+
+
 class global_logger:
 
     local = threading.local()
@@ -20,7 +60,7 @@ class global_logger:
 
 
 def get_logger():
-    return global_logger.local.current
+    return getattr(global_logger.local, "current", None)
 
 
 def lookup(obj, key, default=None):
@@ -42,6 +82,76 @@ def lookup(obj, key, default=None):
     return value
 
 
+def list_objects(query, page_size=None):
+    """Iterates over the objects matched by the query. The objects are
+    requested from the API a page at a time using limit and continue
+    tokens, so processing can start as soon as the first page arrives
+    and the full list is never held in memory at once.
+
+    """
+
+    if page_size is None:
+        page_size = list_page_size
+
+    params = {"limit": page_size}
+
+    # Pages are served from the resource version of the first request.
+    # If the caller is slow consuming the objects, that version can be
+    # compacted before the list is complete, in which case the API
+    # responds with 410 Gone. When that happens restart the list from
+    # the beginning. The API returns objects ordered by their storage
+    # key, so after a restart, objects already returned can be skipped
+    # by comparing against the key of the last one, without needing to
+    # remember every object seen.
+
+    last_key = None
+    restart_key = None
+
+    while True:
+        try:
+            response = query.execute(params=params).json()
+
+        except requests.exceptions.HTTPError as e:
+            if e.response is None or e.response.status_code != 410:
+                raise
+
+            if "continue" not in params:
+                raise
+
+            logger = get_logger()
+
+            if logger:
+                logger.warning(
+                    f"Continue token for listing {query.api_obj_class.kind} expired, restarting list."
+                )
+
+            params = {"limit": page_size}
+
+            restart_key = last_key
+
+            continue
+
+        for obj in response.get("items") or []:
+            namespace = lookup(obj, "metadata.namespace")
+            name = lookup(obj, "metadata.name")
+
+            key = f"{namespace}/{name}" if namespace else name
+
+            if restart_key is not None and key <= restart_key:
+                continue
+
+            last_key = key
+
+            yield query.api_obj_class(query.api, obj)
+
+        token = lookup(response, "metadata.continue")
+
+        if not token:
+            return
+
+        params = {"limit": page_size, "continue": token}
+
+
 def matches_target_namespace(namespace_name, namespace_obj, configs=None):
     """Returns all rules which match the namespace passed as argument.
 
@@ -130,7 +240,7 @@ def reconcile_config(config_name, config_obj):
 
     namespace_query = pykube.Namespace.objects(api)
 
-    for namespace_item in namespace_query:
+    for namespace_item in list_objects(namespace_query):
         rules = list(
             matches_target_namespace(
                 namespace_item.name, namespace_item.obj, [config_obj]
@@ -152,6 +262,58 @@ def reconcile_secret(secret_name, secret_namespace, secret_obj):
         reconcile_config(config_obj["metadata"]["name"], config_obj)
 
 
+def new_target_secret(
+    source_secret_obj, target_secret_name, target_secret_namespace, rule
+):
+    """Returns the definition of the secret to be created in the target
+    namespace as a copy of the source secret.
+
+    """
+
+    return {
+        "apiVersion": "v1",
+        "kind": "Secret",
+        "metadata": {
+            "name": target_secret_name,
+            "namespace": target_secret_namespace,
+            "labels": dict(lookup(rule, "targetSecret.labels", {})),
+        },
+        "type": source_secret_obj.get("type"),
+        "data": source_secret_obj.get("data"),
+    }
+
+
+def updated_target_secret(source_secret_obj, target_secret_obj, rule):
+    """Returns the definition the existing target secret should be
+    updated to, so as to match the source secret. If the target secret
+    is already up to date, then None is returned.
+
+    """
+
+    # We compare by looking at the labels, secret type and data. The
+    # labels from the rule are applied over those of the source secret.
+
+    labels = dict(lookup(source_secret_obj, "metadata.labels", {}))
+    labels.update(lookup(rule, "targetSecret.labels", {}))
+
+    if (
+        source_secret_obj.get("type") == target_secret_obj.get("type")
+        and source_secret_obj.get("data") == target_secret_obj.get("data")
+        and labels == lookup(target_secret_obj, "metadata.labels", {})
+    ):
+        return None
+
+    updated_secret_obj = dict(target_secret_obj)
+
+    updated_secret_obj["metadata"] = dict(target_secret_obj["metadata"])
+    updated_secret_obj["metadata"]["labels"] = labels
+
+    updated_secret_obj["type"] = source_secret_obj.get("type")
+    updated_secret_obj["data"] = source_secret_obj.get("data")
+
+    return updated_secret_obj
+
+
 def update_secret(namespace_name, rule):
     """Updates a single secret in the specified namespace.
 
@@ -206,24 +368,9 @@ def update_secret(namespace_name, rule):
         pass
 
     if target_secret_item is None:
-        target_secret_obj = {
-            "apiVersion": "v1",
-            "kind": "Secret",
-            "metadata": {
-                "name": target_secret_name,
-                "namespace": target_secret_namespace,
-            },
-        }
-
-        #target_secret_labels = source_secret_item.labels
-        #target_secret_labels.update(lookup(rule, "targetSecret.labels", {}))
-
-        target_secret_labels = lookup(rule, "targetSecret.labels", {})
-
-        target_secret_obj["metadata"]["labels"] = target_secret_labels
-
-        target_secret_obj["type"] = source_secret_item.obj["type"]
-        target_secret_obj["data"] = source_secret_item.obj["data"]
+        target_secret_obj = new_target_secret(
+            source_secret_item.obj, target_secret_name, target_secret_namespace, rule
+        )
 
         try:
             pykube.Secret(api, target_secret_obj).create()
@@ -244,27 +391,16 @@ def update_secret(namespace_name, rule):
 
     # If the secret already existed, we need to determine if the
     # original secret had changed and if it had, update the secret in
-    # the namespace. We compare by looking at the labels, secret type
-    # and data.
-
-    labels = lookup(rule, "targetSecret.labels", {})
-
-    source_secret_labels = source_secret_item.labels
-    source_secret_labels.update(labels)
+    # the namespace.
 
-    target_secret_labels = target_secret_item.labels
+    updated_secret_obj = updated_target_secret(
+        source_secret_item.obj, target_secret_item.obj, rule
+    )
 
-    if (
-        source_secret_item.obj["type"] == target_secret_item.obj["type"]
-        and source_secret_item.obj["data"] == target_secret_item.obj["data"]
-        and source_secret_labels == target_secret_labels
-    ):
+    if updated_secret_obj is None:
         return
 
-    target_secret_item.obj["type"] = source_secret_item.obj["type"]
-    target_secret_item.obj["data"] = source_secret_item.obj["data"]
-
-    target_secret_item.obj["metadata"]["labels"] = source_secret_labels
+    target_secret_item.obj = updated_secret_obj
 
     target_secret_item.update()
 
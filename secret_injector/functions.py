@@ -1,9 +1,49 @@
+import logging
+import os
 import threading
 import pykube
+import requests
 
 global_configs = {}
 
 
+def get_list_page_size(default=500):
+    """Returns the number of objects to request per page when listing
+    resources. Can be overridden using the LIST_PAGE_SIZE environment
+    variable, but must be a positive integer, as a limit of zero would
+    disable paging altogether.
+
+    """
+
+    value = os.environ.get("LIST_PAGE_SIZE")
+
+    if value is None:
+        return default
+
+    try:
+        page_size = int(value)
+    except ValueError:
+        page_size = 0
+
+    if page_size <= 0:
+        logging.getLogger(__name__).warning(
+            f"Ignoring invalid LIST_PAGE_SIZE of {value!r}, must be a positive integer."
+        )
+        return default
+
+    return page_size
+
+
+# The page size and list_objects() are kept identical to those in
+# secret_copier.functions, as each package is self contained.
+
+list_page_size = get_list_page_size()
+
+logging.getLogger(__name__).info(
+    f"Listing resources with page size of {list_page_size}."
+)
+
+
 class global_logger:
 
     local = threading.local()
@@ -20,7 +60,7 @@ class global_logger:
 
 
 def get_logger():
-    return global_logger.local.current
+    return getattr(global_logger.local, "current", None)
 
 
 def lookup(obj, key, default=None):
@@ -42,6 +82,76 @@ def lookup(obj, key, default=None):
     return value
 
 
+def list_objects(query, page_size=None):
+    """Iterates over the objects matched by the query. The objects are
+    requested from the API a page at a time using limit and continue
+    tokens, so processing can start as soon as the first page arrives
+    and the full list is never held in memory at once.
+
+    """
+
+    if page_size is None:
+        page_size = list_page_size
+
+    params = {"limit": page_size}
+
+    # Pages are served from the resource version of the first request.
+    # If the caller is slow consuming the objects, that version can be
+    # compacted before the list is complete, in which case the API
+    # responds with 410 Gone. When that happens restart the list from
+    # the beginning. The API returns objects ordered by their storage
+    # key, so after a restart, objects already returned can be skipped
+    # by comparing against the key of the last one, without needing to
+    # remember every object seen.
+
+    last_key = None
+    restart_key = None
+
+    while True:
+        try:
+            response = query.execute(params=params).json()
+
+        except requests.exceptions.HTTPError as e:
+            if e.response is None or e.response.status_code != 410:
+                raise
+
+            if "continue" not in params:
+                raise
+
+            logger = get_logger()
+
+            if logger:
+                logger.warning(
+                    f"Continue token for listing {query.api_obj_class.kind} expired, restarting list."
+                )
+
+            params = {"limit": page_size}
+
+            restart_key = last_key
+
+            continue
+
+        for obj in response.get("items") or []:
+            namespace = lookup(obj, "metadata.namespace")
+            name = lookup(obj, "metadata.name")
+
+            key = f"{namespace}/{name}" if namespace else name
+
+            if restart_key is not None and key <= restart_key:
+                continue
+
+            last_key = key
+
+            yield query.api_obj_class(query.api, obj)
+
+        token = lookup(response, "metadata.continue")
+
+        if not token:
+            return
+
+        params = {"limit": page_size, "continue": token}
+
+
 def matches_target_namespace(namespace_name, namespace_obj, configs=None):
     """Returns all rules which match the namespace passed as argument.
 
@@ -168,7 +278,7 @@ def reconcile_config(config_name, config_obj):
 
     namespace_query = pykube.Namespace.objects(api)
 
-    for namespace_item in namespace_query:
+    for namespace_item in list_objects(namespace_query):
         rules = list(
             matches_target_namespace(
                 namespace_item.name, namespace_item.obj, [config_obj]
@@ -201,7 +311,7 @@ def reconcile_secret(secret_name, namespace_name, secret_obj):
                 namespace=namespace_name
             )
 
-            for service_account_item in service_account_query:
+            for service_account_item in list_objects(service_account_query):
                 if matches_service_account(
                     service_account_item.name, service_account_item.obj, rule
                 ):
@@ -223,13 +333,13 @@ def reconcile_namespace(namespace_name, rule):
 
     secrets_query = pykube.Secret.objects(api).filter(namespace=namespace_name)
 
-    for secret_item in secrets_query:
+    for secret_item in list_objects(secrets_query):
         if matches_source_secret(secret_item.name, secret_item.obj, rule):
             service_account_query = pykube.ServiceAccount.objects(api).filter(
                 namespace=namespace_name
             )
 
-            for service_account_item in service_account_query:
+            for service_account_item in list_objects(service_account_query):
                 if matches_service_account(
                     service_account_item.name, service_account_item.obj, rule
                 ):
@@ -238,6 +348,21 @@ def reconcile_namespace(namespace_name, rule):
                     )
 
 
+def injected_image_pull_secrets(service_account_obj, secret_name):
+    """Returns the image pull secrets the service account should have once
+    the secret has been injected. If the secret is already listed as an
+    image pull secret, then None is returned.
+
+    """
+
+    image_pull_secrets = service_account_obj.get("imagePullSecrets") or []
+
+    if {"name": secret_name} in image_pull_secrets:
+        return None
+
+    return image_pull_secrets + [{"name": secret_name}]
+
+
 def inject_secret(namespace_name, secret_name, service_account_item):
     """Inject the name of the secret into the service account as an image
     pull secret if it is necessary.
@@ -247,16 +372,16 @@ def inject_secret(namespace_name, secret_name, service_account_item):
     # First check if already in the service account, in which case
     # can bail out straight away.
 
-    image_pull_secrets = service_account_item.obj.get("imagePullSecrets", [])
+    image_pull_secrets = injected_image_pull_secrets(
+        service_account_item.obj, secret_name
+    )
 
-    if {"name": secret_name} in image_pull_secrets:
+    if image_pull_secrets is None:
         return
 
     # Now need to update the existing service account to add in the
     # name of the secret.
 
-    image_pull_secrets.append({"name": secret_name})
-
     service_account_item.obj["imagePullSecrets"] = image_pull_secrets
 
     try:
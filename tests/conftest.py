@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Append rather than insert the repository directory, as operator.py
+# would otherwise shadow the standard library module of the same name.
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
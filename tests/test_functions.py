@@ -0,0 +1,120 @@
+import pytest
+
+pytest.importorskip("pykube")
+
+from secret_copier import functions as copier_functions
+from secret_injector import functions as injector_functions
+
+
+def make_secret(labels=None, data=None, type="Opaque"):
+    return {
+        "apiVersion": "v1",
+        "kind": "Secret",
+        "metadata": {"name": "secret", "namespace": "default", "labels": labels or {}},
+        "type": type,
+        "data": data or {"key": "dmFsdWU="},
+    }
+
+
+def test_new_target_secret_uses_rule_labels():
+    source_secret_obj = make_secret(labels={"source": "1"})
+    rule = {"targetSecret": {"labels": {"target": "1"}}}
+
+    target_secret_obj = copier_functions.new_target_secret(
+        source_secret_obj, "target", "namespace", rule
+    )
+
+    assert target_secret_obj["metadata"] == {
+        "name": "target",
+        "namespace": "namespace",
+        "labels": {"target": "1"},
+    }
+    assert target_secret_obj["type"] == "Opaque"
+    assert target_secret_obj["data"] == source_secret_obj["data"]
+
+
+def test_new_target_secret_without_data():
+    source_secret_obj = make_secret()
+    del source_secret_obj["data"]
+
+    target_secret_obj = copier_functions.new_target_secret(
+        source_secret_obj, "target", "namespace", {}
+    )
+
+    assert target_secret_obj["data"] is None
+
+
+def test_updated_target_secret_unchanged():
+    source_secret_obj = make_secret(labels={"source": "1"})
+    target_secret_obj = make_secret(labels={"source": "1", "target": "1"})
+
+    rule = {"targetSecret": {"labels": {"target": "1"}}}
+
+    assert (
+        copier_functions.updated_target_secret(
+            source_secret_obj, target_secret_obj, rule
+        )
+        is None
+    )
+
+
+def test_updated_target_secret_changed_data():
+    source_secret_obj = make_secret(data={"key": "bmV3"})
+    target_secret_obj = make_secret()
+
+    updated_secret_obj = copier_functions.updated_target_secret(
+        source_secret_obj, target_secret_obj, {}
+    )
+
+    assert updated_secret_obj["data"] == {"key": "bmV3"}
+    assert updated_secret_obj["metadata"]["name"] == "secret"
+
+    # The existing target secret is left untouched.
+
+    assert target_secret_obj["data"] == {"key": "dmFsdWU="}
+
+
+def test_updated_target_secret_label_precedence():
+    source_secret_obj = make_secret(labels={"shared": "source", "source": "1"})
+    target_secret_obj = make_secret()
+
+    rule = {"targetSecret": {"labels": {"shared": "rule"}}}
+
+    updated_secret_obj = copier_functions.updated_target_secret(
+        source_secret_obj, target_secret_obj, rule
+    )
+
+    assert updated_secret_obj["metadata"]["labels"] == {
+        "shared": "rule",
+        "source": "1",
+    }
+
+
+def test_injected_image_pull_secrets_adds_secret():
+    service_account_obj = {"imagePullSecrets": [{"name": "other"}]}
+
+    assert injector_functions.injected_image_pull_secrets(
+        service_account_obj, "secret"
+    ) == [{"name": "other"}, {"name": "secret"}]
+
+    # The existing service account is left untouched.
+
+    assert service_account_obj["imagePullSecrets"] == [{"name": "other"}]
+
+
+@pytest.mark.parametrize("image_pull_secrets", [None, []])
+def test_injected_image_pull_secrets_none_listed(image_pull_secrets):
+    service_account_obj = {"imagePullSecrets": image_pull_secrets}
+
+    assert injector_functions.injected_image_pull_secrets(
+        service_account_obj, "secret"
+    ) == [{"name": "secret"}]
+
+
+def test_injected_image_pull_secrets_already_injected():
+    service_account_obj = {"imagePullSecrets": [{"name": "secret"}]}
+
+    assert (
+        injector_functions.injected_image_pull_secrets(service_account_obj, "secret")
+        is None
+    )
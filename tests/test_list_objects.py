@@ -0,0 +1,201 @@
+import importlib
+import json
+import logging
+import threading
+
+import pytest
+
+pykube = pytest.importorskip("pykube")
+requests = pytest.importorskip("requests")
+
+
+@pytest.fixture(params=["secret_copier.functions", "secret_injector.functions"])
+def functions(request):
+    module = importlib.import_module(request.param)
+
+    with module.global_logger(logging.getLogger(request.param)):
+        yield module
+
+
+def make_response(status_code, data):
+    response = requests.Response()
+    response.status_code = status_code
+    response.reason = "Gone" if status_code == 410 else "OK"
+    response.encoding = "utf-8"
+    response._content = json.dumps(data).encode("utf-8")
+    return response
+
+
+class FakeAPI:
+    """Stands in for the HTTP client used by a pykube query, serving a
+    fixed list of namespaces a page at a time. The offset into the list
+    is used as the continue token. Any requests passing a token listed
+    in expired fail with 410 Gone, as the API does once the resource
+    version of the first page has been compacted.
+
+    """
+
+    def __init__(self, names, expired=()):
+        self.names = names
+        self.expired = set(expired)
+        self.requests = []
+
+    def get(self, **kwargs):
+        params = dict(kwargs.get("params") or {})
+
+        self.requests.append(params)
+
+        token = params.get("continue")
+
+        if token in self.expired:
+            self.expired.remove(token)
+
+            return make_response(
+                410,
+                {
+                    "kind": "Status",
+                    "apiVersion": "v1",
+                    "status": "Failure",
+                    "reason": "Expired",
+                    "code": 410,
+                },
+            )
+
+        start = int(token or 0)
+        end = start + params["limit"]
+
+        items = [{"metadata": {"name": name}} for name in self.names[start:end]]
+
+        metadata = {}
+
+        if end < len(self.names):
+            metadata["continue"] = str(end)
+
+        return make_response(
+            200, {"kind": "NamespaceList", "items": items, "metadata": metadata}
+        )
+
+
+class FailingAPI:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def get(self, **kwargs):
+        return make_response(self.status_code, {"kind": "Status"})
+
+
+def names_of(objects):
+    return [item.name for item in objects]
+
+
+def test_chains_continue_tokens(functions):
+    names = [f"ns-{i}" for i in range(7)]
+    api = FakeAPI(names)
+
+    objects = list(functions.list_objects(pykube.Namespace.objects(api), 3))
+
+    assert names_of(objects) == names
+    assert all(isinstance(item, pykube.Namespace) for item in objects)
+
+    assert api.requests == [
+        {"limit": 3},
+        {"limit": 3, "continue": "3"},
+        {"limit": 3, "continue": "6"},
+    ]
+
+
+def test_empty_items(functions):
+    api = FakeAPI([])
+
+    assert names_of(functions.list_objects(pykube.Namespace.objects(api), 3)) == []
+    assert api.requests == [{"limit": 3}]
+
+
+def test_null_items(functions):
+    class NullAPI(FakeAPI):
+        def get(self, **kwargs):
+            return make_response(200, {"items": None, "metadata": {}})
+
+    query = pykube.Namespace.objects(NullAPI([]))
+
+    assert names_of(functions.list_objects(query, 3)) == []
+
+
+def test_restarts_on_expired_token(functions):
+    names = [f"ns-{i}" for i in range(7)]
+    api = FakeAPI(names, expired=["3"])
+
+    query = pykube.Namespace.objects(api)
+
+    assert names_of(functions.list_objects(query, 3)) == names
+
+    assert api.requests == [
+        {"limit": 3},
+        {"limit": 3, "continue": "3"},
+        {"limit": 3},
+        {"limit": 3, "continue": "3"},
+        {"limit": 3, "continue": "6"},
+    ]
+
+
+def test_out_of_order_objects_are_not_dropped(functions):
+    names = ["ns-b", "ns-a", "ns-d", "ns-c"]
+    api = FakeAPI(names)
+
+    query = pykube.Namespace.objects(api)
+
+    assert names_of(functions.list_objects(query, 2)) == names
+
+
+@pytest.mark.parametrize("status_code", [403, 500])
+def test_other_errors_are_raised(functions, status_code):
+    query = pykube.Namespace.objects(FailingAPI(status_code))
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        list(functions.list_objects(query, 3))
+
+
+def test_expired_first_page_is_raised(functions):
+    query = pykube.Namespace.objects(FailingAPI(410))
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        list(functions.list_objects(query, 3))
+
+
+def test_restart_without_logger(functions):
+    names = [f"ns-{i}" for i in range(4)]
+    api = FakeAPI(names, expired=["2"])
+
+    query = pykube.Namespace.objects(api)
+
+    # No logger has been set for a new thread.
+
+    results = []
+
+    thread = threading.Thread(
+        target=lambda: results.append(names_of(functions.list_objects(query, 2)))
+    )
+    thread.start()
+    thread.join()
+
+    assert results == [names]
+
+
+def test_default_page_size(functions):
+    api = FakeAPI([])
+
+    list(functions.list_objects(pykube.Namespace.objects(api)))
+
+    assert api.requests == [{"limit": functions.list_page_size}]
+
+
+@pytest.mark.parametrize(
+    "value,expected", [(None, 500), ("100", 100), ("0", 500), ("-1", 500), ("ten", 500)]
+)
+def test_list_page_size(functions, monkeypatch, value, expected):
+    if value is None:
+        monkeypatch.delenv("LIST_PAGE_SIZE", raising=False)
+    else:
+        monkeypatch.setenv("LIST_PAGE_SIZE", value)
+
+    assert functions.get_list_page_size() == expected
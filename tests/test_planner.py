@@ -0,0 +1,267 @@
+import json
+
+import pytest
+
+pytest.importorskip("pykube")
+pytest.importorskip("yaml")
+
+import planner
+
+
+def make_namespace(name):
+    return {"apiVersion": "v1", "kind": "Namespace", "metadata": {"name": name}}
+
+
+def make_secret(name, namespace):
+    return {
+        "apiVersion": "v1",
+        "kind": "Secret",
+        "metadata": {"name": name, "namespace": namespace},
+        "type": "Opaque",
+        "data": {"key": "dmFsdWU="},
+    }
+
+
+def make_service_account(name, namespace):
+    return {
+        "apiVersion": "v1",
+        "kind": "ServiceAccount",
+        "metadata": {"name": name, "namespace": namespace},
+    }
+
+
+COPIER_CONFIG = {
+    "apiVersion": "failk8s.dev/v1alpha1",
+    "kind": "SecretCopierConfig",
+    "metadata": {"name": "copier"},
+    "spec": {
+        "rules": [
+            {"sourceSecret": {"name": "registry-credentials", "namespace": "registry"}}
+        ]
+    },
+}
+
+INJECTOR_CONFIG = {
+    "apiVersion": "failk8s.dev/v1alpha1",
+    "kind": "SecretInjectorConfig",
+    "metadata": {"name": "injector"},
+    "spec": {
+        "rules": [
+            {
+                "sourceSecrets": {
+                    "nameSelector": {"matchNames": ["registry-credentials"]}
+                }
+            }
+        ]
+    },
+}
+
+
+def make_snapshot():
+    snapshot = planner.Snapshot()
+
+    snapshot.add(make_namespace("registry"))
+    snapshot.add(make_secret("registry-credentials", "registry"))
+
+    for name in ("developer-1", "developer-2"):
+        snapshot.add(make_namespace(name))
+        snapshot.add(make_service_account("default", name))
+
+    return snapshot
+
+
+def counts(estimate):
+    return {
+        "namespaces": len(estimate.namespaces),
+        "objects": len(estimate.objects),
+        "lists": estimate.lists,
+        "gets": estimate.gets,
+        "creates": estimate.creates,
+        "updates": estimate.updates,
+    }
+
+
+def test_load_documents_expands_list(tmp_path):
+    path = tmp_path / "snapshot.json"
+
+    items = [make_namespace("registry"), make_secret("secret", "registry")]
+
+    path.write_text(json.dumps({"apiVersion": "v1", "kind": "List", "items": items}))
+
+    assert list(planner.load_documents(str(path))) == items
+
+
+def test_load_documents_yaml(tmp_path):
+    path = tmp_path / "configs.yaml"
+
+    path.write_text(
+        "kind: SecretCopierConfig\n"
+        "metadata:\n"
+        "  name: copier\n"
+        "---\n"
+        "---\n"
+        "kind: SecretInjectorConfig\n"
+        "metadata:\n"
+        "  name: injector\n"
+    )
+
+    kinds = [obj["kind"] for obj in planner.load_documents(str(path))]
+
+    assert kinds == ["SecretCopierConfig", "SecretInjectorConfig"]
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "[1, 2]",
+        "hello",
+        "kind: Secret\nmetadata: [1]\n",
+        "kind: [Secret]\n",
+        "kind: List\nitems: 5\n",
+        "kind: List\nitems: [1]\n",
+        "kind: Namespace\nmetadata:\n  name: [a]\n",
+    ],
+)
+def test_load_documents_rejects_bad_input(tmp_path, content):
+    path = tmp_path / "bad.yaml"
+
+    path.write_text(content)
+
+    with pytest.raises(ValueError):
+        list(planner.load_documents(str(path)))
+
+
+def test_load_documents_null_kind(tmp_path):
+    path = tmp_path / "snapshot.yaml"
+
+    path.write_text("kind: null\nmetadata:\n  name: x\n")
+
+    assert list(planner.load_documents(str(path))) == [
+        {"kind": None, "metadata": {"name": "x"}}
+    ]
+
+
+def test_copy_then_inject_follow_on():
+    snapshot = make_snapshot()
+
+    lines = []
+
+    plans = planner.Planner(
+        snapshot, [COPIER_CONFIG], [INJECTOR_CONFIG], 500, lines.append
+    )
+
+    # Copying the secret into the two developer namespaces reads the
+    # source and target secret for each.
+
+    estimate, follow_on = plans.plan_copier_config(COPIER_CONFIG)
+
+    assert counts(estimate) == {
+        "namespaces": 2,
+        "objects": 2,
+        "lists": 1,
+        "gets": 4,
+        "creates": 2,
+        "updates": 0,
+    }
+
+    # Each copied secret generates an event, for which the injector reads
+    # the namespace, lists the service accounts and injects the secret.
+
+    assert counts(follow_on) == {
+        "namespaces": 2,
+        "objects": 2,
+        "lists": 2,
+        "gets": 2,
+        "creates": 0,
+        "updates": 2,
+    }
+
+    for name in ("developer-1", "developer-2"):
+        service_account_obj = snapshot.service_accounts[name]["default"]
+        assert service_account_obj["imagePullSecrets"] == [
+            {"name": "registry-credentials"}
+        ]
+
+    # The injector config then finds everything already injected, but
+    # still lists namespaces, secrets and service accounts.
+
+    estimate, follow_on = plans.plan_injector_config(INJECTOR_CONFIG)
+
+    assert counts(estimate) == {
+        "namespaces": 3,
+        "objects": 0,
+        "lists": 7,
+        "gets": 0,
+        "creates": 0,
+        "updates": 0,
+    }
+
+    assert counts(follow_on) == counts(planner.Estimate())
+
+    assert len(lines) == 4
+
+
+def test_copy_from_missing_source():
+    snapshot = planner.Snapshot()
+
+    snapshot.add(make_namespace("registry"))
+    snapshot.add(make_namespace("developer-1"))
+
+    plans = planner.Planner(snapshot, [COPIER_CONFIG], [], 500, planner.no_output)
+
+    estimate, follow_on = plans.plan_copier_config(COPIER_CONFIG)
+
+    assert counts(estimate) == {
+        "namespaces": 1,
+        "objects": 0,
+        "lists": 1,
+        "gets": 1,
+        "creates": 0,
+        "updates": 0,
+    }
+
+
+@pytest.mark.parametrize("count,expected", [(0, 1), (3, 1), (4, 2), (6, 2), (7, 3)])
+def test_list_requests(count, expected):
+    assert planner.list_requests(count, 3) == expected
+
+
+def test_main_quiet(tmp_path, capsys):
+    snapshot_path = tmp_path / "snapshot.json"
+    configs_path = tmp_path / "configs.json"
+
+    items = [
+        make_namespace("registry"),
+        make_secret("registry-credentials", "registry"),
+    ]
+
+    for name in ("developer-1", "developer-2"):
+        items.append(make_namespace(name))
+        items.append(make_service_account("default", name))
+
+    snapshot_path.write_text(json.dumps({"kind": "List", "items": items}))
+    configs_path.write_text(
+        json.dumps({"kind": "List", "items": [COPIER_CONFIG, INJECTOR_CONFIG]})
+    )
+
+    planner.main(["-q", "-c", str(configs_path), "-s", str(snapshot_path)])
+
+    output = capsys.readouterr().out.splitlines()
+
+    assert output[-2] == (
+        "Total: namespaces=3 objects=2 reads=12 (list=8, get=4) "
+        "writes=2 (create=2, update=0)"
+    )
+    assert output[-1] == (
+        "Total follow-on: namespaces=2 objects=2 reads=4 (list=2, get=2) "
+        "writes=2 (create=0, update=2)"
+    )
+
+
+def test_main_rejects_bad_input(tmp_path):
+    path = tmp_path / "bad.json"
+
+    path.write_text("[1, 2]")
+
+    with pytest.raises(SystemExit):
+        planner.main(["-s", str(path)])